@@ -1,14 +1,28 @@
 """
 This module holds the base class for BImgui operators
 """
+import bisect
+import collections.abc
 import functools
 
 import bpy
 import blf
+import numpy as np
 
 from . bimgui_io import BImGuiIO as IO
 from . drawlist import DrawList
 
+# Marks the end of an iterator in tree_view
+_END = object()
+
+def _is_sequence(nodes):
+    # bpy collections support len and indexing but are no collections.abc.Sequence
+    return (hasattr(nodes, "__len__") and hasattr(nodes, "__getitem__") and
+            not isinstance(nodes, collections.abc.Mapping))
+
+def _iter_from(nodes, start):
+    return (nodes[index] for index in range(start, len(nodes)))
+
 def _parse_space_string(string):
     if string == 'VIEW3D':
         return bpy.types.SpaceView3D
@@ -27,6 +41,7 @@ def _load_style():
     return {
         "spacing": 5,
         "padding": 5,
+        "indent": 15,
         "font_size": 11,
         "dpi": bpy.context.preferences.system.dpi,
         "texcolor": tuple(theme.user_interface.wcol_toolbar_item.text),
@@ -69,7 +84,9 @@ class BImGUIOperator(bpy.types.Operator):
     """
     This base class is an abstract modal operator that you can use to create a UI
     Implement the init function to to initialization work
+    Set bimgui_stats_file to a .json or .csv path to export the input statistics when the UI is closed
     """
+    bimgui_stats_file = None
 
     def __init__(self):
         self._should_close = False
@@ -93,6 +110,16 @@ class BImGUIOperator(bpy.types.Operator):
         self._current_bottom_right = None
         self._current_line_start = 0
         self._current_window_has_background = False
+        self._region_offset = (0, 0)
+        self._text_style = None
+
+        # Saved layout state of the currently open child regions
+        self._child_stack = []
+
+        # Keys of all expanded tree nodes
+        self._tree_open = set()
+        # Cumulative visible row counts of sibling lists in tree_view
+        self._tree_row_cache = dict()
 
     def __get_draw_functions(self):
         callables = [getattr(self, method) for method in dir(self)
@@ -126,6 +153,8 @@ class BImGUIOperator(bpy.types.Operator):
             self.io.unregister_listener(handle['listener'])
             handle['handle'] = None
             handle['listener'] = None
+        if self.bimgui_stats_file:
+            self.io.stats.export(self.bimgui_stats_file)
         # Redraw all windows
         for window in bpy.context.window_manager.windows:
             for area in window.screen.areas:
@@ -140,6 +169,30 @@ class BImGUIOperator(bpy.types.Operator):
             max(self._last_region[0][0] + size[0], self._current_bottom_right[0]),
             min(self._last_region[0][1] - size[1], self._current_bottom_right[1]))
 
+    def _newline_many(self, sizes):
+        """
+        Vectorized version of _newline for elements stacked below each other.
+        Returns the top left positions of all elements as array of shape (n, 2)
+        """
+        sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+        if not len(sizes):
+            return np.zeros((0, 2))
+        positions = np.empty_like(sizes)
+        positions[:, 0] = self._current_line_start
+        positions[0, 0] = self._next_position[0]
+        positions[0, 1] = self._next_position[1]
+        positions[1:, 1] = self._next_position[1] - np.cumsum(
+            sizes[:-1, 1] + self.style['spacing'])
+
+        self._last_region = (tuple(positions[-1].tolist()), tuple(sizes[-1].tolist()))
+        self._next_position = (
+            self._current_line_start,
+            float(positions[-1, 1] - sizes[-1, 1] - self.style['spacing']))
+        self._current_bottom_right = (
+            max(float(np.max(positions[:, 0] + sizes[:, 0])), self._current_bottom_right[0]),
+            min(float(np.min(positions[:, 1] - sizes[:, 1])), self._current_bottom_right[1]))
+        return positions
+
     def init(self, context, event):
         """
         Implement this function if you need to to something in the invoke function
@@ -194,6 +247,14 @@ class BImGUIOperator(bpy.types.Operator):
         self._current_top_left = self._last_region[0]
         self._current_bottom_right = self._last_region[0]
         self._next_position = self._last_region[0]
+        self._child_stack = []
+
+        # Resolve everything needed by the widgets once per frame
+        self._region_offset = (region.x, region.y)
+        self._text_style = self.draw_list.text_style(
+            self.style["font_size"],
+            self.style["dpi"],
+            self.style["texcolor"])
 
         self.draw_list.clear()
 
@@ -230,17 +291,38 @@ class BImGUIOperator(bpy.types.Operator):
             region = self._last_region
 
         mouse_pos = self.get_mouse_pos()
+        clip = self.draw_list.clip_rect
+        if clip is not None and not (
+                clip[0] <= mouse_pos[0] <= clip[2] and clip[1] <= mouse_pos[1] <= clip[3]):
+            return False
         r_x = mouse_pos[0] - region[0][0]
         r_y = region[0][1] - mouse_pos[1]
         return 0 <= r_x <= region[1][0] and 0 <= r_y < region[1][1]
 
+    def is_hovered_many(self, positions, sizes):
+        """
+        Vectorized version of is_hovered.
+        Returns a boolean array which is True for all hovered regions
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+        mouse_pos = self.get_mouse_pos()
+        clip = self.draw_list.clip_rect
+        if clip is not None and not (
+                clip[0] <= mouse_pos[0] <= clip[2] and clip[1] <= mouse_pos[1] <= clip[3]):
+            return np.zeros(len(positions), dtype=bool)
+        r_x = mouse_pos[0] - positions[:, 0]
+        r_y = positions[:, 1] - mouse_pos[1]
+        return (0 <= r_x) & (r_x <= sizes[:, 0]) & (0 <= r_y) & (r_y < sizes[:, 1])
+
     def get_mouse_pos(self):
         """
-        Return the mouse position relative to the current window
+        Return the mouse position relative to the window of the current frame
         """
-        region = bpy.context.region
         if len(self.io.mouse_pos) == 2:
-            return [self.io.mouse_pos[0] - region.x, self.io.mouse_pos[1] - region.y]
+            return [
+                self.io.mouse_pos[0] - self._region_offset[0],
+                self.io.mouse_pos[1] - self._region_offset[1]]
         else:
             return [-1000, -1000]
 
@@ -261,7 +343,7 @@ class BImGUIOperator(bpy.types.Operator):
                 self._next_position[0] + self.style["padding"],
                 self._next_position[1] - self.style["padding"]
             ),
-            **self.style)
+            self._text_style)
         self.draw_list.add_filled_rectangle(
             self._next_position,
             size,
@@ -309,7 +391,7 @@ class BImGUIOperator(bpy.types.Operator):
                 self._next_position[0] + box_size + self.style["padding"],
                 self._next_position[1] - self.style["padding"]
             ),
-            **self.style
+            self._text_style
         )
         self._newline(size)
         return not value if is_hovered and self.io.mouse_clicked['LEFTMOUSE'] else value
@@ -337,7 +419,7 @@ class BImGUIOperator(bpy.types.Operator):
         self.draw_list.add_text(
             text,
             position,
-            **self.style
+            self._text_style
         )
         self._newline(size)
 
@@ -354,7 +436,7 @@ class BImGUIOperator(bpy.types.Operator):
             "{} ({}%)".format(text, int(value)) if show_progress else text,
             #pylint: disable=line-too-long
             (self._next_position[0] + self.style["padding"], self._next_position[1]- self.style["padding"]),
-            **self.style)
+            self._text_style)
 
         alpha = min(1.0, max(0.0, value / 100))
         self.draw_list.add_filled_rectangle(
@@ -367,6 +449,274 @@ class BImGUIOperator(bpy.types.Operator):
             self.style["button"])
         self._newline(size)
 
+    def label_many(self, texts, with_background=False):
+        """
+        Draws one label per entry of texts below each other.
+        Returns a tuple of boolean arrays (hovered, clicked) with one entry per label
+        """
+        blf.size(0, self.style["font_size"], self.style["dpi"])
+        sizes = np.array([blf.dimensions(0, text) for text in texts], dtype=float).reshape(-1, 2)
+        offset = np.zeros(2)
+        if with_background:
+            sizes += 2 * self.style["padding"]
+            offset = np.array([self.style["padding"], -self.style["padding"]])
+
+        positions = self._newline_many(sizes)
+        self.draw_list.add_texts(texts, positions + offset, self._text_style)
+
+        hovered = self.is_hovered_many(positions, sizes)
+        return hovered, hovered & self.io.mouse_clicked['LEFTMOUSE']
+
+    def progress_many(self, texts, values, show_progress=True):
+        """
+        Draws one progress bar per entry of texts and values below each other.
+        values can be any sequence or numpy array of percentages.
+        Returns a tuple of boolean arrays (hovered, clicked) with one entry per bar
+        Raises a ValueError if texts and values have different lengths
+        """
+        values = np.asarray(values, dtype=float).reshape(-1)
+        if len(texts) != len(values):
+            raise ValueError(
+                "progress_many got {} texts but {} values".format(len(texts), len(values)))
+        blf.size(0, self.style["font_size"], self.style["dpi"])
+        if show_progress:
+            sizes = [blf.dimensions(0, "{} (100%)".format(text)) for text in texts]
+            texts = ["{} ({}%)".format(text, int(value)) for text, value in zip(texts, values.tolist())]
+        else:
+            sizes = [blf.dimensions(0, text) for text in texts]
+        sizes = np.array(sizes, dtype=float).reshape(-1, 2) + 2 * self.style["padding"]
+
+        positions = self._newline_many(sizes)
+        self.draw_list.add_texts(
+            texts,
+            positions + (self.style["padding"], -self.style["padding"]),
+            self._text_style)
+
+        filled = np.clip(values / 100, 0.0, 1.0)[:, None] * (1, 0) * sizes
+        self.draw_list.add_filled_rectangles(
+            positions,
+            filled + (0, 1) * sizes,
+            self.style["progress"])
+        self.draw_list.add_filled_rectangles(
+            positions + filled,
+            sizes - filled,
+            self.style["button"])
+
+        hovered = self.is_hovered_many(positions, sizes)
+        return hovered, hovered & self.io.mouse_clicked['LEFTMOUSE']
+
+    def _tree_row(self, text, key, has_children, height=None):
+        """
+        Draws a single row of a tree and toggles its expansion state if it was clicked.
+        Returns a tuple (is_open, clicked)
+        """
+        blf.size(0, self.style["font_size"], self.style["dpi"])
+        text_size = blf.dimensions(0, text)
+        size = (
+            self.style["indent"] + 2 * self.style["padding"] + text_size[0],
+            height if height is not None else 2 * self.style["padding"] + text_size[1])
+
+        is_hovered = self.is_hovered((self._next_position, size))
+        clicked = is_hovered and self.io.mouse_clicked['LEFTMOUSE']
+        if clicked and has_children:
+            self._tree_open.symmetric_difference_update((key,))
+            self._tree_row_cache.clear()
+        is_open = key in self._tree_open
+
+        if is_hovered:
+            self.draw_list.add_filled_rectangle(
+                self._next_position,
+                size,
+                self.style["button_hovered"])
+        if has_children:
+            self.draw_list.add_text(
+                "-" if is_open else "+",
+                (
+                    self._next_position[0] + self.style["padding"],
+                    self._next_position[1] - self.style["padding"]
+                ),
+                self._text_style)
+        self.draw_list.add_text(
+            text,
+            (
+                self._next_position[0] + self.style["indent"] + self.style["padding"],
+                self._next_position[1] - self.style["padding"]
+            ),
+            self._text_style)
+
+        self._newline(size)
+        return is_open, clicked
+
+    def tree_node(self, text, key=None):
+        """
+        Draws a collapsible tree node.
+        Returns True if the node is expanded. In this case the following elements are indented
+        until tree_pop is called.
+        The expansion state is stored under key (defaults to text)
+        """
+        is_open, _ = self._tree_row(text, text if key is None else key, True)
+        if is_open:
+            self._current_line_start += self.style["indent"]
+            self._next_position = (self._current_line_start, self._next_position[1])
+        return is_open
+
+    def tree_pop(self):
+        """
+        Ends the indentation of an expanded tree node
+        """
+        self._current_line_start -= self.style["indent"]
+        self._next_position = (self._current_line_start, self._next_position[1])
+
+    def tree_invalidate(self):
+        """
+        Call this function if the hierarchy shown by a tree_view changed.
+        tree_view caches the number of visible rows of expanded subtrees,
+        the cache is cleared automatically if a node is expanded or collapsed
+        """
+        self._tree_row_cache.clear()
+
+    def _tree_rows(self, nodes, cache_key, children, key, has_children):
+        """
+        Returns the cumulative number of visible rows before each node in nodes
+        """
+        prefix = self._tree_row_cache.get(cache_key)
+        if prefix is not None and len(prefix) == len(nodes) + 1:
+            return prefix
+        prefix = [0]
+        for node in nodes:
+            rows = 1
+            node_key = key(node)
+            if has_children(node) and node_key in self._tree_open:
+                sub_nodes = children(node)
+                if not _is_sequence(sub_nodes):
+                    sub_nodes = list(sub_nodes)
+                rows += self._tree_rows(
+                    sub_nodes, ("node", node_key), children, key, has_children)[-1]
+            prefix.append(prefix[-1] + rows)
+        self._tree_row_cache[cache_key] = prefix
+        return prefix
+
+    def tree_view(self, roots, children, **kwargs):
+        """
+        Draws a lazily expanded tree.
+        The callback children(node) is only called for expanded nodes.
+        Rows before first_row are skipped without taking any space.
+        Inside a clip rectangle (e.g. begin_child) rows above the clip rectangle only advance the
+        layout, and drawing stops at the bottom of the clip rectangle (or region) or after max_rows rows.
+        If roots and children(node) return sequences (lists, tuples, bpy collections), skipped rows are
+        found by bisecting cached row counts of the expanded subtrees, so the cost of a frame only depends
+        on the number of visible rows. Call tree_invalidate if the hierarchy changes.
+        Other iterables are walked node by node up to the first visible row.
+        Optional keyword arguments:
+            label: Callback returning the text of a node (default: str)
+            key: Callback returning a hashable key used to store the expansion state (default: the node)
+            has_children: Callback returning wether a node can be expanded (default: always True)
+            first_row: Index of the first row to show (default: 0)
+            max_rows: Maximum number of rows to draw (default: None)
+            tree_id: Hashable id to distinguish the cached row counts of multiple trees (default: None)
+        Returns the node clicked in this frame or None
+        """
+        label = kwargs.get("label", str)
+        key = kwargs.get("key", lambda node: node)
+        has_children = kwargs.get("has_children", lambda node: True)
+        first_row = kwargs.get("first_row", 0)
+        max_rows = kwargs.get("max_rows", None)
+        tree_id = kwargs.get("tree_id", None)
+
+        blf.size(0, self.style["font_size"], self.style["dpi"])
+        row_height = 2 * self.style["padding"] + blf.dimensions(0, "Mg")[1]
+        row_stride = row_height + self.style["spacing"]
+        line_start = self._current_line_start
+
+        # Rows lying completely above the clip rectangle are only counted
+        clip = self.draw_list.clip_rect
+        hidden_rows = 0
+        if clip is not None and self._next_position[1] - row_height >= clip[3]:
+            hidden_rows = int((self._next_position[1] - row_height - clip[3]) // row_stride) + 1
+        bottom = clip[1] if clip is not None else 0
+        self._next_position = (
+            self._next_position[0],
+            self._next_position[1] - hidden_rows * row_stride)
+        skip = first_row + hidden_rows
+
+        # Descend directly to the first visible row where possible
+        stack = []
+        nodes = roots
+        cache_key = ("root", tree_id)
+        while skip > 0 and _is_sequence(nodes):
+            prefix = self._tree_rows(nodes, cache_key, children, key, has_children)
+            if skip >= prefix[-1]:
+                stack.append(iter(()))
+                skip = 0
+                break
+            index = bisect.bisect_right(prefix, skip) - 1
+            skip -= prefix[index]
+            if skip == 0:
+                stack.append(_iter_from(nodes, index))
+                break
+            # The first visible row lies inside the subtree of nodes[index]
+            node = nodes[index]
+            skip -= 1
+            stack.append(_iter_from(nodes, index + 1))
+            nodes = children(node)
+            cache_key = ("node", key(node))
+        else:
+            stack.append(iter(nodes))
+
+        clicked = None
+        drawn = 0
+        while stack:
+            node = next(stack[-1], _END)
+            if node is _END:
+                stack.pop()
+                continue
+            node_key = key(node)
+            expandable = has_children(node)
+            if skip > 0:
+                skip -= 1
+            else:
+                if max_rows is not None and drawn >= max_rows:
+                    break
+                if self._next_position[1] <= bottom:
+                    break
+                self._current_line_start = line_start + (len(stack) - 1) * self.style["indent"]
+                self._next_position = (self._current_line_start, self._next_position[1])
+                _, node_clicked = self._tree_row(label(node), node_key, expandable, row_height)
+                if node_clicked:
+                    clicked = node
+                drawn += 1
+            if expandable and node_key in self._tree_open:
+                stack.append(iter(children(node)))
+
+        self._current_line_start = line_start
+        self._next_position = (line_start, self._next_position[1])
+        return clicked
+
+    def begin_child(self, size, scroll=0):
+        """
+        Starts a child region of the given size at the current position.
+        All elements until the matching end_child are clipped to this region
+        and shifted up by scroll pixels
+        """
+        position = self._next_position
+        self._child_stack.append(
+            (position, size, self._current_line_start, self._current_bottom_right))
+        self.draw_list.push_clip_rect(position, size)
+        self._current_line_start = position[0]
+        self._next_position = (position[0], position[1] + scroll)
+
+    def end_child(self):
+        """
+        Ends the current child region.
+        The child region is handled as a single element of the given size
+        """
+        position, size, line_start, bottom_right = self._child_stack.pop()
+        self.draw_list.pop_clip_rect()
+        self._current_line_start = line_start
+        self._current_bottom_right = bottom_right
+        self._next_position = position
+        self._newline(size)
+
     def same_line(self, col=None):
         """
         The next element will be drawn at on the same line as the previous one
@@ -1,6 +1,175 @@
 """
 This module implements the Keyobard and Mouse input handling in the class 'BImGuiIO'
+and the input latency statistics in the class 'IOStats'
 """
+import collections
+import csv
+import json
+import math
+import time
+
+class IOStats:
+    """
+    Collects statistics about the events handled by a BImGuiIO.
+    Events are timestamped when they reach the modal operator. The latency of an event is the
+    time until the draw callback of a listener first processed it (see BImGuiIO.signal_processed).
+    An event is coalesced for a listener if an event of the same type and value is still pending
+    for it. coalesced counts every incoming event at most once (if it was coalesced for any
+    listener), the per listener counts are reported in summary()["latency"].
+    ignored counts the events BImGuiIO filters out on purpose (e.g. modifier keys, 'NONE' and
+    INBETWEEN_MOUSEMOVE) except for timer events, which are counted in timer_ticks.
+    No event is lost silently, so there is no dropped count
+    """
+    def __init__(self, max_samples=1024):
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        """
+        Removes all collected data
+        """
+        self._start = time.perf_counter()
+        self._pending = dict()
+        self._latencies = dict()
+        self._coalesced_per_listener = collections.Counter()
+        self._processed_per_listener = collections.Counter()
+        self.event_counts = collections.Counter()
+        self.ignored = 0
+        self.coalesced = 0
+        self.timer_ticks = 0
+
+    def record_event(self, key, listeners, timestamp=None):
+        """
+        Records an event identified by key = (type, value) for all given listeners
+        """
+        timestamp = timestamp if timestamp is not None else time.perf_counter()
+        self.event_counts[key[0]] += 1
+        coalesced = False
+        for listener in listeners:
+            pending = self._pending.setdefault(listener, {})
+            if key in pending:
+                self._coalesced_per_listener[listener] += 1
+                coalesced = True
+            else:
+                pending[key] = timestamp
+        if coalesced:
+            self.coalesced += 1
+
+    def record_processed(self, listener, timestamp=None):
+        """
+        Records that the listener processed all its pending events
+        """
+        pending = self._pending.get(listener)
+        if not pending:
+            return
+        timestamp = timestamp if timestamp is not None else time.perf_counter()
+        samples = self._latencies.setdefault(
+            listener,
+            collections.deque(maxlen=self.max_samples))
+        samples.extend(timestamp - event_time for event_time in pending.values())
+        self._processed_per_listener[listener] += len(pending)
+        pending.clear()
+
+    def discard_listener(self, listener):
+        """
+        Drops the pending events of a listener. Collected latencies are kept
+        """
+        self._pending.pop(listener, None)
+
+    @property
+    def elapsed(self):
+        """
+        Returns the time in seconds since the statistics were reset
+        """
+        return time.perf_counter() - self._start
+
+    @property
+    def listeners(self):
+        """
+        Returns the listeners with latency samples
+        """
+        return sorted(self._latencies.keys())
+
+    def event_rate(self, event_type=None):
+        """
+        Returns the number of handled events per second.
+        If event_type is given only events of this type are counted
+        """
+        count = (sum(self.event_counts.values()) if event_type is None
+                 else self.event_counts.get(event_type, 0))
+        return count / max(self.elapsed, 1e-9)
+
+    def latency_percentiles(self, listener=None, percentiles=(50, 90, 99)):
+        """
+        Returns a dict mapping the given percentiles to latencies in seconds.
+        Only the last max_samples latencies of each listener are used.
+        If listener is None the samples of all listeners are used.
+        Returns an empty dict if there are no samples
+        """
+        if listener is None:
+            samples = [value for values in self._latencies.values() for value in values]
+        else:
+            samples = list(self._latencies.get(listener, []))
+        if not samples:
+            return {}
+        samples.sort()
+        # Nearest rank method
+        return {
+            p: samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))]
+            for p in percentiles
+        }
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Returns all statistics as a dict
+        Counts and rates cover the whole time since the last reset. Latency percentiles are computed from
+        the last latency_window (max_samples) events of each listener, "samples" is the number of events
+        in this window and "processed" the number of events processed since the last reset
+        """
+        return {
+            "elapsed": self.elapsed,
+            "event_rate": self.event_rate(),
+            "event_counts": dict(self.event_counts),
+            "ignored": self.ignored,
+            "coalesced": self.coalesced,
+            "timer_ticks": self.timer_ticks,
+            "latency_window": self.max_samples,
+            "latency": {
+                listener: {
+                    "samples": len(self._latencies[listener]),
+                    "processed": self._processed_per_listener[listener],
+                    "coalesced": self._coalesced_per_listener[listener],
+                    "percentiles": self.latency_percentiles(listener, percentiles)
+                } for listener in self.listeners
+            }
+        }
+
+    def export(self, path, percentiles=(50, 90, 99)):
+        """
+        Writes the statistics to path.
+        Files ending with .csv get one (metric, listener, value) row per value, all other files are written as json.
+        See summary for the time span covered by each value
+        """
+        summary = self.summary(percentiles)
+        if not path.lower().endswith(".csv"):
+            with open(path, "w") as out_file:
+                json.dump(summary, out_file, indent=2)
+            return
+
+        with open(path, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(("metric", "listener", "value"))
+            for metric in ("elapsed", "event_rate", "ignored", "coalesced", "timer_ticks",
+                           "latency_window"):
+                writer.writerow((metric, "", summary[metric]))
+            for event_type, count in sorted(summary["event_counts"].items()):
+                writer.writerow(("events_{}".format(event_type), "", count))
+            for listener, latency in summary["latency"].items():
+                writer.writerow(("samples", listener, latency["samples"]))
+                writer.writerow(("processed", listener, latency["processed"]))
+                writer.writerow(("coalesced", listener, latency["coalesced"]))
+                for p, value in latency["percentiles"].items():
+                    writer.writerow(("latency_p{}".format(p), listener, value))
 
 class BImGuiIO:
     """
@@ -11,6 +180,8 @@ class BImGuiIO:
         self.__next_listener_id = 0
         self.__listener_states = dict()
 
+        self.stats = IOStats()
+
         self._key_down_prev = {}
         self._key_down = {}
 
@@ -29,7 +200,7 @@ class BImGuiIO:
         self.__mouse_types = ['MOUSEMOVE', 'MIDDLEMOUSE', 'LEFTMOUSE', 'RIGHTMOUSE']
         self.__ignored = [
             'NONE',
-            'TIMER', 'TIMER0', 'TIMER1', 'TIMER2', 'TIMER_JOBS', 'TIMER_AUTOSAFE'
+            'TIMER', 'TIMER0', 'TIMER1', 'TIMER2', 'TIMER_JOBS', 'TIMER_AUTOSAFE',
             'WINDOW_DEACTIVATE',
             'BUTTON4MOUSE', 'BUTTON5MOUSE', 'BUTTON6MOUSE', 'BUTTON7MOUSE',
             'PEN', 'ERASER',
@@ -42,14 +213,23 @@ class BImGuiIO:
         """
         This will handle an input event and update the internal io state
         """
+        timestamp = time.perf_counter()
         self.ctrl = event.ctrl
         self.alt = event.alt
         self.shift = event.shift
 
         self.mouse_pos = [event.mouse_x, event.mouse_y]
 
+        if event.type.startswith('TIMER'):
+            self.stats.timer_ticks += 1
+            return
         if event.type in self.__ignored:
+            self.stats.ignored += 1
             return
+        self.stats.record_event(
+            (event.type, event.value),
+            self.__listener_states.keys(),
+            timestamp)
         if event.type in self.__mouse_types:
             if event.type != 'MOUSEMOVE':
                 if event.value == 'PRESS':
@@ -89,6 +269,7 @@ class BImGuiIO:
         Remove a listener
         """
         self.__listener_states.pop(key, None)
+        self.stats.discard_listener(key)
 
     def set_current_listener(self, index):
         """
@@ -105,6 +286,7 @@ class BImGuiIO:
         """
         index = index if index is not None else self.__current_listener
         self.__listener_states[index] = {}
+        self.stats.record_processed(index)
 
     @property
     def mouse_clicked(self):
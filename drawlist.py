@@ -2,63 +2,148 @@
 This module implements the DrawList class.
 The class can be used to create multiple simple shapes which are drawn with view draw calls
 """
+import math
+
 import bgl
 import bpy
 import blf
 import gpu
+import numpy as np
 from gpu_extras.batch import batch_for_shader
 
+from . shaders import load_shader
+
+# Shapes are drawn this many pixels larger than their extent to leave room for antialiasing
+_SDF_MARGIN = 1.0
+
+class TextStyle:
+    """
+    Font and color settings shared by many text commands.
+    Use DrawList.text_style to get an interned instance
+    """
+    __slots__ = ("font_id", "font_size", "dpi", "color", "max_height")
+
+    def __init__(self, font_id, font_size, dpi, color):
+        self.font_id = font_id
+        self.font_size = font_size
+        self.dpi = dpi
+        self.color = color
+        # Upper bound for the height of a line of text used for clipping
+        self.max_height = 2 * font_size * dpi / 72
+
+class TextCommand:
+    """
+    A single string to draw
+    """
+    __slots__ = ("text", "x", "y", "style")
+
+    def __init__(self, text, x, y, style):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.style = style
+
 class DrawList:
     """
     Implements some low level primitives for rendering
     """
     def __init__(self):
-        self._geometry = dict()
-        self._text = dict()
+        self._batches = dict()
 
         self._current_channel = 0
+        self._clip_stack = []
+
+        self._sdf_shader = None
+
+        self._text_styles = dict()
+        self._default_text_style = self.text_style(dpi=bpy.context.preferences.system.dpi)
 
     def clear(self):
         """
         Clears the drawlist
         """
-        self._geometry = dict()
-        self._text = dict()
+        self._batches = dict()
         self._current_channel = 0
+        self._clip_stack = []
 
     def draw(self):
         """
         This will draw the data
+        Within a channel and clip rectangle all shapes are drawn in the order they were added,
+        text is drawn on top of them
         """
-        shader = gpu.shader.from_builtin('2D_FLAT_COLOR')
+        flat_shader = gpu.shader.from_builtin('2D_FLAT_COLOR')
+
+        # Batches are drawn by channel, batches of the same channel in insertion order
+        keys = sorted(self._batches.keys(), key=lambda key: key[0])
 
-        layers = set(self._geometry.keys()).union(set(self._text.keys()))
-        layers = sorted(layers)
+        # Clip rectangles are in region coordinates, the viewport origin maps them to the
+        # framebuffer blender draws the region into (region local since 2.80)
+        viewport = bgl.Buffer(bgl.GL_INT, 4)
+        bgl.glGetIntegerv(bgl.GL_VIEWPORT, viewport)
+        origin = (viewport[0], viewport[1])
+
+        # Remember the scissor state set up by blender for this region
+        scissor_enabled = bgl.glIsEnabled(bgl.GL_SCISSOR_TEST)
+        scissor_box = bgl.Buffer(bgl.GL_INT, 4)
+        bgl.glGetIntegerv(bgl.GL_SCISSOR_BOX, scissor_box)
+        scissor_box = tuple(scissor_box)
 
         # Draw all elements
         bgl.glEnable(bgl.GL_BLEND)
-        for layer in layers:
-            if layer in self._geometry:
-                batch = batch_for_shader(
-                    shader, 'TRIS',
-                    {
-                        "pos": self._geometry[layer]["pos"],
-                        "color": self._geometry[layer]["color"]
-                    },
-                    indices=self._geometry[layer]["indices"])
+        for key in keys:
+            clip = key[1]
+            if clip is not None:
+                x_min = origin[0] + int(clip[0])
+                y_min = origin[1] + int(clip[1])
+                x_max = origin[0] + int(clip[2] + 0.5)
+                y_max = origin[1] + int(clip[3] + 0.5)
+                if scissor_enabled:
+                    x_min = max(x_min, scissor_box[0])
+                    y_min = max(y_min, scissor_box[1])
+                    x_max = min(x_max, scissor_box[0] + scissor_box[2])
+                    y_max = min(y_max, scissor_box[1] + scissor_box[3])
+                if x_max <= x_min or y_max <= y_min:
+                    continue
+                bgl.glEnable(bgl.GL_SCISSOR_TEST)
+                bgl.glScissor(x_min, y_min, x_max - x_min, y_max - y_min)
+
+            batch_data = self._batches[key]
+            for kind, data in batch_data["runs"]:
+                if kind == "flat":
+                    shader = flat_shader
+                    attributes = {"pos": data["pos"], "color": data["color"]}
+                else:
+                    shader = self._sdf_shader
+                    if shader is None:
+                        shader = self._sdf_shader = load_shader("sdf_shapes")
+                    shader.bind()
+                    attributes = {
+                        "pos": data["pos"],
+                        "color": data["color"],
+                        "local": data["local"],
+                        "shape": data["shape"]
+                    }
+                batch = batch_for_shader(shader, 'TRIS', attributes, indices=data["indices"])
                 batch.draw(shader)
             # Draw text
-            for text_data in self._text.get(layer, []):
-                blf.size(0, text_data["font_size"], text_data["dpi"])
+            style = None
+            for command in batch_data["text"]:
+                if command.style is not style:
+                    style = command.style
+                    blf.size(style.font_id, style.font_size, style.dpi)
+                    blf.color(style.font_id, *style.color)
                 # Get text size
-                text_size = blf.dimensions(0, text_data["text"])
-                blf.position(
-                    0,
-                    text_data["position"][0],
-                    text_data["position"][1] - text_size[1],
-                    0)
-                blf.color(0, *text_data["color"])
-                blf.draw(0, text_data["text"])
+                text_size = blf.dimensions(style.font_id, command.text)
+                blf.position(style.font_id, command.x, command.y - text_size[1], 0)
+                blf.draw(style.font_id, command.text)
+
+            if clip is not None:
+                # Restore blenders scissor state
+                if scissor_enabled:
+                    bgl.glScissor(*scissor_box)
+                else:
+                    bgl.glDisable(bgl.GL_SCISSOR_TEST)
         bgl.glDisable(bgl.GL_BLEND)
 
     @property
@@ -75,52 +160,275 @@ class DrawList:
         self._current_channel = value
 
     @property
-    def geometry(self):
+    def clip_rect(self):
         """
-        Returns the geomtry data for the current layer
+        Returns the current clip rectangle as (x_min, y_min, x_max, y_max) or None
         """
-        return self._geometry.setdefault(
-            self._current_channel,
+        return self._clip_stack[-1] if self._clip_stack else None
+
+    def push_clip_rect(self, position, size, intersect=True):
+        """
+        Restricts all following primitives to the rectangle with the given top left position and size.
+        If intersect is True the rectangle is intersected with the current clip rectangle
+        """
+        x_min, y_min = position[0], position[1] - size[1]
+        x_max, y_max = position[0] + size[0], position[1]
+        current = self.clip_rect
+        if intersect and current is not None:
+            x_min = max(x_min, current[0])
+            y_min = max(y_min, current[1])
+            x_max = max(x_min, min(x_max, current[2]))
+            y_max = max(y_min, min(y_max, current[3]))
+        self._clip_stack.append((x_min, y_min, x_max, y_max))
+
+    def pop_clip_rect(self):
+        """
+        Restores the clip rectangle active before the last call to push_clip_rect
+        """
+        assert self._clip_stack, "pop_clip_rect called without matching push_clip_rect"
+        self._clip_stack.pop()
+
+    def is_clipped(self, x_min, y_min, x_max, y_max):
+        """
+        Returns True if the given rectangle lies completely outside the current clip rectangle
+        """
+        clip = self.clip_rect
+        return clip is not None and (
+            x_max <= clip[0] or x_min >= clip[2] or y_max <= clip[1] or y_min >= clip[3])
+
+    @property
+    def _batch(self):
+        return self._batches.setdefault(
+            (self._current_channel, self.clip_rect),
             {
-                "pos": [],
-                "color": [],
-                "indices": []
+                "runs": [],
+                "text": []
             }
         )
 
+    def _run(self, kind):
+        """
+        Returns the geometry data of the last run of the current batch if it has the given kind
+        ('flat' or 'sdf') and starts a new run otherwise.
+        Runs are drawn in order, so shapes keep the order they were added in
+        """
+        runs = self._batch["runs"]
+        if not runs or runs[-1][0] != kind:
+            data = {"pos": [], "color": [], "indices": []}
+            if kind == "sdf":
+                data["local"] = []
+                data["shape"] = []
+            runs.append((kind, data))
+        return runs[-1][1]
+
+    @property
+    def geometry(self):
+        """
+        Returns the list of (kind, data) geometry runs for the current layer and clip rectangle
+        """
+        return self._batch["runs"]
+
     @property
     def text(self):
         """
-        Returns the text data list for the current layer
+        Returns the text data list for the current layer and clip rectangle
         """
-        return self._text.setdefault(self._current_channel, [])
+        return self._batch["text"]
 
     def add_filled_rectangle(self, position, size, color):
         """
         Add a colored rectangle to the draw list
+        Rectangles are drawn without antialiasing, so adjacent rectangles leave no seams
         """
+        if self.is_clipped(
+                position[0], position[1] - size[1],
+                position[0] + size[0], position[1]):
+            return
+        geometry = self._run("flat")
         vertices = (
             position,
             (position[0] + size[0], position[1]),
             (position[0], position[1] - size[1]),
             (position[0] + size[0], position[1] - size[1]))
-        offset = len(self.geometry["pos"])
+        offset = len(geometry["pos"])
         indices = (
             (offset + 0, offset + 1, offset + 2),
             (offset + 2, offset + 1, offset + 3))
         colors = [color, color, color, color]
-        self.geometry["pos"] += vertices
-        self.geometry["indices"] += indices
-        self.geometry["color"] += colors
+        geometry["pos"] += vertices
+        geometry["indices"] += indices
+        geometry["color"] += colors
+
+    def _clip_mask(self, x_min, y_min, x_max, y_max):
+        """
+        Vectorized version of is_clipped.
+        Returns a boolean array which is True for all rectangles inside the current clip rectangle
+        """
+        clip = self.clip_rect
+        if clip is None:
+            return np.ones(np.shape(x_min), dtype=bool)
+        return ((x_max > clip[0]) & (x_min < clip[2]) &
+                (y_max > clip[1]) & (y_min < clip[3]))
+
+    def add_filled_rectangles(self, positions, sizes, colors):
+        """
+        Add many colored rectangles to the draw list at once.
+        positions and sizes are arrays of shape (n, 2), colors is either a single color
+        or an array of shape (n, 4)
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+        colors = np.broadcast_to(np.asarray(colors, dtype=float), (len(positions), 4))
+
+        visible = self._clip_mask(
+            positions[:, 0], positions[:, 1] - sizes[:, 1],
+            positions[:, 0] + sizes[:, 0], positions[:, 1])
+        positions, sizes, colors = positions[visible], sizes[visible], colors[visible]
+        if not len(positions):
+            return
 
-    def add_text(self, text, position, **kwargs):
+        # Same vertex order as add_filled_rectangle
+        vertices = np.repeat(positions, 4, axis=0).reshape(-1, 4, 2)
+        vertices[:, 1::2, 0] += sizes[:, None, 0]
+        vertices[:, 2:, 1] -= sizes[:, None, 1]
+
+        geometry = self._run("flat")
+        offset = len(geometry["pos"])
+        first = offset + 4 * np.arange(len(positions))[:, None]
+        indices = (first + np.array([[0, 1, 2, 2, 1, 3]])).reshape(-1, 3)
+
+        geometry["pos"] += vertices.reshape(-1, 2).tolist()
+        geometry["indices"] += indices.tolist()
+        geometry["color"] += np.repeat(colors, 4, axis=0).tolist()
+
+    def _add_sdf_quad(self, center, axis, half_size, radius, thickness, color):
+        """
+        Adds a single quad rendered with the signed distance shader.
+        The quad is centered at center and its local x axis points along the unit vector axis
+        """
+        extent = (half_size[0] + _SDF_MARGIN, half_size[1] + _SDF_MARGIN)
+        local = (
+            (-extent[0], extent[1]),
+            (extent[0], extent[1]),
+            (-extent[0], -extent[1]),
+            (extent[0], -extent[1]))
+        vertices = [
+            (
+                center[0] + l_x * axis[0] - l_y * axis[1],
+                center[1] + l_x * axis[1] + l_y * axis[0]
+            ) for l_x, l_y in local]
+        if self.is_clipped(
+                min(v[0] for v in vertices), min(v[1] for v in vertices),
+                max(v[0] for v in vertices), max(v[1] for v in vertices)):
+            return
+        geometry = self._run("sdf")
+        offset = len(geometry["pos"])
+        shape = (half_size[0], half_size[1], radius, thickness)
+        geometry["pos"] += vertices
+        geometry["local"] += local
+        geometry["color"] += [color, color, color, color]
+        geometry["shape"] += [shape, shape, shape, shape]
+        geometry["indices"] += (
+            (offset + 0, offset + 1, offset + 2),
+            (offset + 2, offset + 1, offset + 3))
+
+    def add_line(self, start, end, color, thickness=1.0, rounded=True):
+        """
+        Add an antialiased line segment to the draw list
+        If rounded is True the line has round caps
+        """
+        d_x, d_y = end[0] - start[0], end[1] - start[1]
+        length = math.hypot(d_x, d_y)
+        axis = (d_x / length, d_y / length) if length > 0 else (1.0, 0.0)
+        cap = 0.5 * thickness if rounded else 0.0
+        self._add_sdf_quad(
+            (0.5 * (start[0] + end[0]), 0.5 * (start[1] + end[1])),
+            axis,
+            (0.5 * length + cap, 0.5 * thickness),
+            cap,
+            0.0,
+            color)
+
+    def add_circle(self, center, radius, color, thickness=0.0):
+        """
+        Add an antialiased circle to the draw list
+        If thickness is larger than 0 only a ring of this thickness is drawn
+        """
+        self._add_sdf_quad(center, (1.0, 0.0), (radius, radius), radius, thickness, color)
+
+    def add_rounded_rectangle(self, position, size, color, radius=4.0):
+        """
+        Add a colored rectangle with rounded corners to the draw list
+        """
+        half_size = (0.5 * size[0], 0.5 * size[1])
+        self._add_sdf_quad(
+            (position[0] + half_size[0], position[1] - half_size[1]),
+            (1.0, 0.0),
+            half_size,
+            min(radius, *half_size),
+            0.0,
+            color)
+
+    def add_border(self, position, size, color, thickness=1.0, radius=0.0):
+        """
+        Add the border of a (rounded) rectangle to the draw list
+        The border is drawn inside the rectangle
+        """
+        half_size = (0.5 * size[0], 0.5 * size[1])
+        self._add_sdf_quad(
+            (position[0] + half_size[0], position[1] - half_size[1]),
+            (1.0, 0.0),
+            half_size,
+            min(radius, *half_size),
+            thickness,
+            color)
+
+    def text_style(self, font_size=11, dpi=72, color=(1, 1, 1), font_id=0):
+        """
+        Returns the interned TextStyle for the given settings.
+        Resolve styles once (e.g. per frame) and pass them to add_text
+        """
+        color = tuple(color) if len(color) == 4 else (*color, 1)
+        key = (font_id, font_size, dpi, color)
+        style = self._text_styles.get(key)
+        if style is None:
+            style = self._text_styles[key] = TextStyle(font_id, font_size, dpi, color)
+        return style
+
+    def add_text(self, text, position, style=None):
         """
         Add text to draw to the renderlist
+        Text is drawn on top of all shapes of the same channel and clip rectangle,
+        use a higher channel to draw shapes over text.
+        Text is rejected if it lies completely outside the current clip rectangle.
+        If no style is given white text using the system dpi is drawn
+        """
+        style = style or self._default_text_style
+        clip = self.clip_rect
+        if clip is not None and (
+                position[0] >= clip[2] or
+                position[1] <= clip[1] or
+                position[1] - style.max_height >= clip[3]):
+            return
+        self.text.append(TextCommand(text, position[0], position[1], style))
+
+    def add_texts(self, texts, positions, style=None):
+        """
+        Add many strings sharing the same style to the renderlist at once.
+        positions is an array of shape (n, 2)
         """
-        self.text.append({
-            "font_size": kwargs.get("font_size", 11),
-            "dpi": kwargs.get("dpi", bpy.context.preferences.system.dpi),
-            "position":  (position[0], position[1]),
-            "text": text,
-            "color": (*kwargs.get("color", (1, 1, 1)), 1)
-        })
+        style = style or self._default_text_style
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        clip = self.clip_rect
+        if clip is not None:
+            visible = ((positions[:, 0] < clip[2]) &
+                       (positions[:, 1] > clip[1]) &
+                       (positions[:, 1] - style.max_height < clip[3]))
+        else:
+            visible = np.ones(len(positions), dtype=bool)
+        self.text.extend(
+            TextCommand(texts[i], x, y, style)
+            for i, x, y in zip(
+                np.flatnonzero(visible).tolist(),
+                positions[visible, 0].tolist(),
+                positions[visible, 1].tolist()))
@@ -2,6 +2,38 @@ import os
 import re
 import gpu
 
+_SECTION_RE = re.compile("//\\s*--(\\w+)\\s*[\\n\\r]+")
+
+_SHADER_CACHE = {}
+
+def _create_shader(filename):
+    '''
+    Creates a GPUShader from a file containing sections starting with "//--vertex", "//--fragment", ...
+    Everything before the first section is prepended to all sections
+    '''
+    with open(filename) as src_file:
+        src = src_file.read()
+    shaders = {}
+    preamble = ""
+    last_type = ""
+    while True:
+        match = _SECTION_RE.search(src)
+        if match is None:
+            break
+        if shaders:
+            shaders[last_type] = preamble + src[:match.start()]
+        else:
+            preamble = src[:match.start()]
+        shaders[match[1]] = ""
+        last_type = match[1]
+        src = src[match.end():]
+    if shaders:
+        shaders[last_type] = preamble + src
+
+    fragment_shader = shaders.pop('fragment', "")
+    vertex_shader = shaders.pop('vertex', "")
+    return gpu.types.GPUShader(vertex_shader, fragment_shader, **shaders)
+
 class ReloadingShader:
     '''
     A class that wraps loading shaders from files.
@@ -12,8 +44,6 @@ class ReloadingShader:
         self.filename = filename
         self._last_modified = 0
         self._shader = None
-        #pylint: disable=invalid-name
-        self.re = re.compile("//\\s*--(\\w+)\\s*[\\n\\r]+")
         self.reload_shaders()
 
     def reload_shaders(self):
@@ -23,38 +53,7 @@ class ReloadingShader:
         last_modified = os.stat(self.filename).st_mtime
 
         if self._last_modified < last_modified:
-            with open(self.filename) as src_file:
-                src = src_file.read()
-            # print(src)
-            shaders = {}
-            preamble = ""
-            last_type = ""
-            while True:
-                match = self.re.search(src)
-                if match is None:
-                    break
-                if shaders:
-                    # print("Source:\n{}".format(src[ : match.start()]))
-                    shaders[last_type] = preamble + src[:match.start()]
-                else:
-                    # print("Preamble: {}".format(src[: match.start()]))
-                    preamble = src[:match.start()]
-                # print("shader: {}".format(match[1]))
-                shaders[match[1]] = ""
-                last_type = match[1]
-                src = src[match.end():]
-            if shaders:
-                # print("Source:\n{}".format(src))
-                shaders[last_type] = preamble + src
-
-            fragment_shader = shaders.get('fragment', "")
-            vertex_shader = shaders.get('vertex', "")
-            shaders.pop('vertex', None)
-            shaders.pop('fragment', None)
-
-            self.shader = gpu.types.GPUShader(vertex_shader,
-                                              fragment_shader,
-                                              **shaders)
+            self.shader = _create_shader(self.filename)
 
             self._last_modified = last_modified
 
@@ -89,7 +88,22 @@ class ReloadingShader:
     def uniform_vector_int(self, location, buffer, length, count):
         self.shader.uniform_vector_int(location, buffer, length, count)
 
+def _shader_path(shader):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "shaders", "{}.glsl".format(shader))
+
 def get_shader(shader):
-    path = os.path.abspath(os.path.join("./shaders", "{}.glsl".format(shader)))
+    '''
+    Returns a ReloadingShader for the given shader name. Only use this during development
+    '''
+    path = _shader_path(shader)
     print("Loading shader {}".format(path))
-    return ReloadingShader(path)
\ No newline at end of file
+    return ReloadingShader(path)
+
+def load_shader(shader):
+    '''
+    Returns the GPUShader for the given shader name.
+    The shader is compiled on the first call and cached afterwards
+    '''
+    if shader not in _SHADER_CACHE:
+        _SHADER_CACHE[shader] = _create_shader(_shader_path(shader))
+    return _SHADER_CACHE[shader]
\ No newline at end of file
@@ -0,0 +1,43 @@
+//--vertex
+uniform mat4 ModelViewProjectionMatrix;
+
+in vec2 pos;
+in vec4 color;
+in vec2 local;
+in vec4 shape;
+
+out vec4 v_Color;
+out vec2 v_Local;
+flat out vec4 v_Shape;
+
+void main()
+{
+    v_Color = color;
+    v_Local = local;
+    v_Shape = shape;
+    gl_Position = ModelViewProjectionMatrix * vec4(pos, 0.0, 1.0);
+}
+
+//--fragment
+in vec4 v_Color;
+in vec2 v_Local;
+flat in vec4 v_Shape;
+
+out vec4 fragColor;
+
+// Signed distance to a box with half extents b and corner radius r
+float roundedBox(vec2 p, vec2 b, float r)
+{
+    vec2 q = abs(p) - b + r;
+    return length(max(q, 0.0)) + min(max(q.x, q.y), 0.0) - r;
+}
+
+void main()
+{
+    // v_Shape: half width, half height, corner radius, border thickness (0 = filled)
+    float d = roundedBox(v_Local, v_Shape.xy, v_Shape.z);
+    if (v_Shape.w > 0.0) d = abs(d + 0.5 * v_Shape.w) - 0.5 * v_Shape.w;
+    float alpha = clamp(0.5 - d, 0.0, 1.0);
+    if (alpha <= 0.0) discard;
+    fragColor = vec4(v_Color.rgb, v_Color.a * alpha);
+}
@@ -2,6 +2,8 @@
 This module implements a simple text UI.
 """
 
+import bpy
+
 from . bimgui import BImGUIOperator, bimgui_draw
 
 class TestUIOperator(BImGUIOperator):
@@ -32,6 +34,17 @@ class TestUIOperator(BImGUIOperator):
         self._bool = self.checkbox("Boolean", self._bool)
         self.progress("Sample Progress", 25)
         self.progress("Sample Progress", 57, False)
+        self.progress_many(["Job {}".format(i) for i in range(5)], [0, 25, 50, 75, 100])
+
+        if self.tree_node("Collections"):
+            self.begin_child((200, 150))
+            self.tree_view(
+                bpy.context.scene.collection.children,
+                lambda collection: collection.children,
+                label=lambda collection: collection.name,
+                has_children=lambda collection: len(collection.children) > 0)
+            self.end_child()
+            self.tree_pop()
 
         self.end_ui()
 